@@ -10,30 +10,228 @@ Endpoints:
     GET /states/{state_name} - Retrieve specific state population data
 """
 
-from fastapi import FastAPI, HTTPException
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
 import sqlite3
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 
-app = FastAPI(
-    title="USA State Population API",
-    description="API for querying aggregated US state population data",
-    version="1.0.0"
-)
+# SQLite database written by fetch_data.py
+DB_PATH = 'demographics.db'
+
+# Seconds between checks for new data written by fetch_data.py
+REFRESH_INTERVAL = 60
+
+# Held while the shared connection is in use by a refresh, so shutdown
+# can't close it underneath a refresh running in a worker thread
+REFRESH_LOCK = threading.Lock()
+
+
+def open_db_connection() -> sqlite3.Connection:
+    """
+    Open the SQLite connection used to load state data.
+    
+    The connection is created once at startup and reused for every reload.
+    check_same_thread is disabled because refreshes run in worker threads
+    other than the one that opened it. WAL journaling lets it read while fetch_data.py writes, and
+    the busy timeout retries through any remaining lock. The database file
+    is memory-mapped so reads are served from the OS page cache without read
+    syscalls, and the connection is put in autocommit, query-only mode since
+    the API never writes.
+    
+    Returns:
+        sqlite3.Connection: Configured database connection
+    """
+    connection = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA busy_timeout=5000")
+    connection.execute("PRAGMA cache_size=-64000")
+    connection.execute("PRAGMA temp_store=memory")
+    connection.execute("PRAGMA mmap_size=268435456")
+    connection.execute("PRAGMA query_only=1")
+    return connection
+
+
+def get_db_inode() -> Optional[int]:
+    """
+    Get the inode of the database file.
+    
+    A changed inode means the file was deleted and recreated (e.g. to pick
+    up a new schema), which an open connection would never see: it keeps
+    reading the old, unlinked file.
+    
+    Returns:
+        int | None: Inode of DB_PATH, or None if the file doesn't exist
+    """
+    try:
+        return os.stat(DB_PATH).st_ino
+    except FileNotFoundError:
+        return None
 
-def get_db_connection():
+
+def connect_db() -> None:
+    """
+    Open the shared connection and remember which file it points at.
+    
+    The inode is only recorded once the connection is open, so a failed
+    reopen is retried by the next refresh check.
+    """
+    inode = get_db_inode()
+    app.state.db = open_db_connection()
+    app.state.db_inode = inode
+
+
+def get_data_version() -> int:
+    """
+    Get the current database version.
+    
+    SQLite's data_version changes whenever another connection (e.g. fetch_data.py)
+    commits to the database, so comparing it with the version of the loaded
+    data tells whether a reload is needed.
+    
+    Returns:
+        int: Current data version of the shared connection
     """
-    Establish a connection to the SQLite database.
+    return app.state.db.execute("PRAGMA data_version").fetchone()[0]
+
+
+def with_etag(body: bytes) -> Tuple[bytes, str]:
+    """
+    Pair a JSON response body with its ETag.
     
+    Args:
+        body (bytes): JSON response body
+        
     Returns:
-        Tuple[sqlite3.Connection, sqlite3.Cursor]: Database connection and cursor objects
+        Tuple[bytes, str]: JSON body and its quoted ETag
     """
-    connection = sqlite3.connect('demographics.db')
-    cursor = connection.cursor()
-    return connection, cursor
+    etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+    return body, etag
+
+
+def json_response(request: Request, body: bytes, etag: str) -> Response:
+    """
+    Build a JSON response with cache validation headers.
+    
+    Returns 304 Not Modified without a body if the client's If-None-Match
+    header already holds the current ETag. Tags are compared weakly, as
+    If-None-Match requires, so a W/ prefix added by a proxy still matches.
+    
+    Args:
+        request (Request): Incoming request
+        body (bytes): Prebuilt JSON body
+        etag (str): ETag of the body
+        
+    Returns:
+        Response: 200 response with the body, or an empty 304 response
+    """
+    headers = {"ETag": etag, "Cache-Control": f"max-age={REFRESH_INTERVAL}"}
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if etag in tags or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def load_states() -> None:
+    """
+    Load all states from the database into memory.
+    
+    Each state's response body and ETag are computed once, along with those
+    for the full list, so requests are served with a single dict lookup.
+    SQLite encodes each row with json_object, so no per-row dicts are built
+    in Python; the list body is joined from the per-state bodies.
+    The data version is read before the query so a commit landing in between
+    triggers another reload rather than being missed.
+    
+    If fetch_data.py hasn't created the state_population table yet, the
+    data is loaded as empty and picked up by a later refresh.
+    """
+    data_version = get_data_version()
+    table_exists = app.state.db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'state_population'"
+    ).fetchone()
+
+    rows = []
+    if table_exists:
+        rows = app.state.db.execute(
+            "SELECT state_name, json_object('state_name', state_name, 'population', population) "
+            "FROM state_population"
+        ).fetchall()
+
+    bodies = [(row[0], row[1].encode()) for row in rows]
+
+    app.state.states = {state_name: with_etag(body) for state_name, body in bodies}
+    app.state.states_json = with_etag(b"[" + b",".join(body for _, body in bodies) + b"]")
+    app.state.data_version = data_version
+
+
+def refresh_once() -> None:
+    """
+    Reload the in-memory state data if the database has changed.
+    
+    Reloads only when fetch_data.py has committed new data. If the database
+    file has been replaced, the connection is reopened on the new file first.
+    Database errors are logged and the previously loaded data keeps being
+    served until a later refresh succeeds.
+    """
+    with REFRESH_LOCK:
+        try:
+            inode = get_db_inode()
+            if inode is not None and inode != app.state.db_inode:
+                app.state.db.close()
+                connect_db()
+                load_states()
+            elif get_data_version() != app.state.data_version:
+                load_states()
+
+        except sqlite3.Error as e:
+            logging.error(f"Error refreshing state data: {e}")
+
+
+async def refresh_states() -> None:
+    """
+    Refresh the in-memory state data every REFRESH_INTERVAL seconds.
+    
+    Each refresh runs in a worker thread, so SQLite I/O and lock waits
+    (up to the busy timeout) never block requests on the event loop.
+    """
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL)
+        await asyncio.to_thread(refresh_once)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Open the database connection and load state data on startup,
+    keep it refreshed while running, and clean up on shutdown.
+    """
+    connect_db()
+    load_states()
+    refresh_task = asyncio.create_task(refresh_states())
+    yield
+    refresh_task.cancel()
+    with REFRESH_LOCK:
+        app.state.db.close()
+
+
+app = FastAPI(
+    title="USA State Population API",
+    description="API for querying aggregated US state population data",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
 
 
 @app.get("/")
-def read_root():
+async def read_root():
     """
     Health check endpoint.
     
@@ -44,53 +242,49 @@ def read_root():
 
 
 @app.get("/states")
-def get_all_states():
+async def get_all_states(request: Request) -> Response:
     """
     Retrieve population data for all US states.
     
+    Args:
+        request (Request): Incoming request, checked for If-None-Match
+        
     Returns:
-        List[Dict[str, any]]: List of dictionaries containing state_name and population
+        Response: 200 with a JSON list of objects containing state_name and
+        population, or an empty 304 if If-None-Match holds the current ETag
         
-    Example:
+    Example body:
         [
             {"state_name": "California", "population": 39538223},
             {"state_name": "Texas", "population": 29145505}
         ]
     """
-    connection, cursor = get_db_connection()
-
-    cursor.execute("SELECT * FROM state_population")
-    rows = cursor.fetchall()
-    connection.close()
-    
-    return [{"state_name": row[0], "population": row[1]} for row in rows]
+    return json_response(request, *app.state.states_json)
 
 
 @app.get("/states/{state_name}")
-def get_state(state_name):
+async def get_state(state_name: str, request: Request) -> Response:
     """
     Retrieve population data for a specific US state.
     
     Args:
         state_name (str): Name of the state to query
+        request (Request): Incoming request, checked for If-None-Match
         
     Returns:
-        Dict[str, any]: Dictionary containing state_name and population
+        Response: 200 with a JSON object containing state_name and population,
+        or an empty 304 if If-None-Match holds the current ETag
         
     Raises:
         HTTPException: 404 error if state is not found in database
         
-    Example:
+    Example body:
         {"state_name": "California", "population": 39538223}
     """
-    connection, cursor = get_db_connection()
+    state = app.state.states.get(state_name)
 
-    cursor.execute("SELECT * FROM state_population WHERE state_name = ?", (state_name,))
-    row = cursor.fetchone()
-    connection.close()
-    
-    if row:
-        return {"state_name": row[0], "population": row[1]}
+    if state:
+        return json_response(request, *state)
     else:
         raise HTTPException(status_code=404, detail="State not found")
     
\ No newline at end of file
@@ -5,7 +5,7 @@ This module fetches county-level population data from the ArcGIS REST API,
 aggregates it by state, and stores the results in a SQLite database.
 
 Features:
-    - Handles paginated API responses
+    - Handles paginated API responses, fetching pages concurrently
     - Aggregates county data by state
     - Stores data in SQLite database
     - Supports scheduled periodic updates
@@ -15,10 +15,14 @@ Usage:
     python fetch_data.py --schedule   # Run every minute
 """
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sqlite3
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import sys
-import schedule
 import time
 import logging
 from typing import List, Dict
@@ -29,57 +33,147 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# SQLite database read by api.py
+DB_PATH = 'demographics.db'
+
 # ArcGIS REST API endpoint
 API_URL = "https://services.arcgis.com/P3ePLMYs2RVChkJx/ArcGIS/rest/services/USA_Census_Counties/FeatureServer/0/query"
 
+# Seconds between runs in --schedule mode
+SCHEDULE_INTERVAL = 60
+
+# Records requested per page; the server caps this at its maxRecordCount
+PAGE_SIZE = 2000
+
+# Maximum number of pages requested in parallel
+MAX_WORKERS = 10
+
+# Timeout in seconds for each API request
+REQUEST_TIMEOUT = 30
+
+# Shared HTTP session so connections are kept alive and reused across pages
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=MAX_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.3)
+))
+SESSION.headers.update({"Accept-Encoding": "gzip"})
+
 
-def fetch_counties_data():
+def parse_response(response):
     """
-    Fetch all county population data from ArcGIS REST API.
+    Parse an ArcGIS API response, raising on any failure.
     
-    Handles pagination automatically by checking 'exceededTransferLimit' flag
-    and incrementing resultOffset until all records are retrieved.
+    ArcGIS reports query failures as HTTP 200 with an "error" object in the
+    body, so the status code alone isn't enough.
     
+    Args:
+        response (requests.Response): Response from the API
+        
     Returns:
-        List[Dict]: List of feature dictionaries containing county data
+        Dict: Parsed JSON response
         
-    Example response structure:
-        [
-            {"attributes": {"STATE_NAME": "Texas", "POPULATION": 12345}},
-            ...
-        ]
+    Raises:
+        requests.HTTPError: If the HTTP status is an error
+        RuntimeError: If the body contains an ArcGIS error
+    """
+    response.raise_for_status()
+    data = orjson.loads(response.content)
+    if "error" in data:
+        raise RuntimeError(f"ArcGIS API error: {data['error']}")
+    return data
+
+
+def fetch_page(params, offset):
+    """
+    Fetch a single page of county data starting at the given offset.
+    
+    Args:
+        params (Dict): Query parameters shared by all pages
+        offset (int): Index of the first record to return
+        
+    Returns:
+        Dict: Parsed JSON response for the page
+    """
+    response = SESSION.get(
+        API_URL, params={**params, "resultOffset": offset}, timeout=REQUEST_TIMEOUT
+    )
+    return parse_response(response)
+
+
+def fetch_record_count(params):
+    """
+    Fetch the total number of records matching the query.
+    
+    Args:
+        params (Dict): Query parameters shared by all pages
+        
+    Returns:
+        int: Total record count reported by the API
+    """
+    response = SESSION.get(
+        API_URL, params={**params, "returnCountOnly": "true"}, timeout=REQUEST_TIMEOUT
+    )
+    return parse_response(response)["count"]
+
+
+def iter_counties_data():
+    """
+    Fetch all county population data from ArcGIS REST API.
+    
+    Requests pages of up to PAGE_SIZE records and uses the size of the first
+    page as the effective page size, since the server may return fewer. If
+    'exceededTransferLimit' is set, the total record count is requested and
+    the remaining pages are fetched concurrently by offset.
+    
+    Features are yielded as each page arrives, so they can be aggregated
+    without holding every county in memory at once. Errors are not caught
+    here: a failed page propagates to the consumer so an incomplete fetch
+    can't be mistaken for a complete one.
+    
+    Yields:
+        Dict: Feature dictionary containing county data
+        
+    Raises:
+        Exception: If any page or the record count can't be fetched, or
+            fewer counties arrive than the record count reported
+        
+    Example feature structure:
+        {"attributes": {"STATE_NAME": "Texas", "POPULATION": 12345}}
     """
     params = {
         "where": "1=1",
         "outFields": "POPULATION,STATE_NAME",
         "returnGeometry": "false",
         "f": "json",
-        "resultOffset": 0
+        "resultRecordCount": PAGE_SIZE
     }
     
-    all_features = []
-
-    # Fetch data with pagination support
-    while True:
-        try:
-            response = requests.get(API_URL, params=params)
-            data = response.json()
-            features = data.get("features", []) 
-            all_features.extend(features)
-            
-            # Check if there are more records to fetch
-            if not data.get("exceededTransferLimit", False):
-                break
-            else:
-                # Update offset for next batch
-                params["resultOffset"] = params.get("resultOffset", 0) + len(features)
-        
-        except Exception as e:
-            logging.error(f"Error fetching data: {e}")
-            return all_features
+    count = 0
+
+    data = fetch_page(params, 0)
+    features = data.get("features", [])
+    count += len(features)
+    yield from features
+
+    # Fetch the remaining pages in parallel
+    if data.get("exceededTransferLimit", False) and features:
+        page_size = len(features)
+        total = fetch_record_count(params)
+        offsets = range(page_size, total, page_size)
+
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for data in executor.map(lambda offset: fetch_page(params, offset), offsets):
+                features = data.get("features", [])
+                count += len(features)
+                yield from features
+
+        # Short or empty pages would otherwise go unnoticed
+        if count != total:
+            raise RuntimeError(f"Fetched {count} of {total} counties")
                 
-    logging.info(f"Fetched {len(all_features)} counties")
-    return all_features
+    logging.info(f"Fetched {count} counties")
     
 
 def aggregate_by_state(features):
@@ -90,7 +184,7 @@ def aggregate_by_state(features):
     Handles None/null population values by treating them as 0.
     
     Args:
-        features (List[Dict]): List of county features from API
+        features (Iterable[Dict]): County features from API
         
     Returns:
         Dict[str, int]: Dictionary mapping state names to total population
@@ -102,17 +196,15 @@ def aggregate_by_state(features):
         ]
         Output: {"Texas": 3000}
     """
-    total_sum_population = {}
+    total_sum_population = defaultdict(int)
 
     for item in features:
-        state = item["attributes"]['STATE_NAME']
-        population = item["attributes"]['POPULATION'] or 0
-    
-        total_sum_population[state] = total_sum_population.get(state, 0) + population
+        attributes = item["attributes"]
+        total_sum_population[attributes['STATE_NAME']] += attributes['POPULATION'] or 0
     
     logging.info(f"Aggregated data for {len(total_sum_population)} states")
 
-    return total_sum_population
+    return dict(total_sum_population)
 
 
 def save_to_database(state_data):
@@ -120,19 +212,23 @@ def save_to_database(state_data):
     Save aggregated state population data to SQLite database.
     
     Creates the state_population table if it doesn't exist.
-    Uses INSERT OR REPLACE to update existing records.
+    Uses INSERT OR REPLACE to update existing records, written in a single
+    transaction so the whole batch costs one journal sync.
     
     Args:
         state_data (Dict[str, int]): Dictionary mapping state names to populations
         
     Database Schema:
-        Table: state_population
+        Table: state_population (WITHOUT ROWID, clustered on state_name)
         Columns:
             - state_name (TEXT, PRIMARY KEY)
             - population (INTEGER)
     """
+    connection = None
     try:
-        connection = sqlite3.connect('demographics.db')
+        connection = sqlite3.connect(DB_PATH)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
         cursor = connection.cursor()
 
         # Create table if it doesn't exist
@@ -140,15 +236,15 @@ def save_to_database(state_data):
             CREATE TABLE IF NOT EXISTS state_population (
                 state_name TEXT PRIMARY KEY,
                 population INTEGER
-            )
+            ) WITHOUT ROWID
         ''')
 
-        # Insert or update state data
-        for state_name, population in state_data.items():
-            cursor.execute(
-                "INSERT OR REPLACE INTO state_population VALUES (?, ?)", 
-                (state_name, population)
-            )
+        # Insert or update state data in one transaction
+        cursor.execute("BEGIN")
+        cursor.executemany(
+            "INSERT OR REPLACE INTO state_population VALUES (?, ?)",
+            state_data.items()
+        )
 
         connection.commit()
 
@@ -161,6 +257,9 @@ def save_to_database(state_data):
     
     except Exception as e:
         logging.error(f"Error saving to database: {e}")
+        if connection:
+            connection.rollback()
+            connection.close()
 
 
 def main():
@@ -169,25 +268,31 @@ def main():
     
     Orchestrates the complete data pipeline:
     1. Fetch county data from API
-    2. Aggregate by state
+    2. Aggregate by state as pages arrive
     3. Save to database
+    
+    If the fetch fails part way, nothing is saved, so the database keeps
+    the last complete data instead of undercounted totals.
     """
     logging.info("Starting data fetch...")
-    all_features = fetch_counties_data()
-    total_sum_population = aggregate_by_state(all_features)
+    try:
+        total_sum_population = aggregate_by_state(iter_counties_data())
+    except Exception as e:
+        logging.error(f"Error fetching data, database not updated: {e}")
+        return
+
     save_to_database(total_sum_population)
 
 
 if __name__ == "__main__":
     if "--schedule" in sys.argv:
-        # Scheduled mode - run every minute
-        logging.info("Starting scheduled mode - will run every 1 minute")
-        main()  # Run immediately
-        schedule.every(1).minute.do(main)
+        # Scheduled mode - run immediately, then sleep until the next run is due
+        logging.info(f"Starting scheduled mode - will run every {SCHEDULE_INTERVAL} seconds")
         
         while True:
-            schedule.run_pending()
-            time.sleep(60)
+            next_run = time.monotonic() + SCHEDULE_INTERVAL
+            main()
+            time.sleep(max(0, next_run - time.monotonic()))
     else:
         # Single execution mode
         main()
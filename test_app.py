@@ -5,16 +5,69 @@ Tests both the FastAPI endpoints and the data aggregation logic
 to ensure correct functionality of the population data system.
 """
 
+import os
+import sqlite3
+import orjson
 import pytest
-from fetch_data import aggregate_by_state
+import api
+import fetch_data
+from fetch_data import aggregate_by_state, iter_counties_data
 from fastapi.testclient import TestClient
 from api import app
 
-# Test client for API testing
-client = TestClient(app)
+# State data written to the test database
+TEST_STATES = {"Texas": 29145505, "California": 39538223, "Ohio": 11799448}
 
 
-def test_get_all_states():
+@pytest.fixture(scope="session")
+def client(tmp_path_factory):
+    """
+    Test client for API testing, shared by all tests in the session.
+    
+    Builds a temporary database with save_to_database and points both
+    modules at it, so the tests don't depend on a local demographics.db.
+    Used as a context manager so the app's startup/shutdown handlers run
+    and the state data is loaded.
+    """
+    db_path = str(tmp_path_factory.mktemp("db") / "demographics.db")
+    original_paths = (api.DB_PATH, fetch_data.DB_PATH)
+    api.DB_PATH = fetch_data.DB_PATH = db_path
+    fetch_data.save_to_database(TEST_STATES)
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+    api.DB_PATH, fetch_data.DB_PATH = original_paths
+
+
+@pytest.fixture
+def fresh_db(client, tmp_path):
+    """
+    Point the running app at a new, empty database file for one test.
+    
+    The app's connection and loaded data are swapped out for the test and
+    restored afterwards, so the shared client keeps serving TEST_STATES.
+    
+    Returns:
+        str: Path of the new database file
+    """
+    state_attrs = ("db", "db_inode", "states", "states_json", "data_version")
+    saved_state = {name: getattr(app.state, name) for name in state_attrs}
+    original_paths = (api.DB_PATH, fetch_data.DB_PATH)
+    api.DB_PATH = fetch_data.DB_PATH = str(tmp_path / "demographics.db")
+    api.connect_db()
+    api.load_states()
+
+    yield api.DB_PATH
+
+    app.state.db.close()
+    for name, value in saved_state.items():
+        setattr(app.state, name, value)
+    api.DB_PATH, fetch_data.DB_PATH = original_paths
+
+
+@pytest.mark.integration
+def test_get_all_states(client):
     """
     Test GET /states endpoint returns list of all states.
     
@@ -33,7 +86,8 @@ def test_get_all_states():
     assert "population" in data[0]
 
 
-def test_get_single_state():
+@pytest.mark.integration
+def test_get_single_state(client):
     """
     Test GET /states/{state_name} endpoint for specific state.
     
@@ -50,7 +104,8 @@ def test_get_single_state():
     assert data["population"] > 0
 
 
-def test_get_invalid_state():
+@pytest.mark.integration
+def test_get_invalid_state(client):
     """
     Test GET /states/{state_name} returns 404 for non-existent state.
     
@@ -61,45 +116,318 @@ def test_get_invalid_state():
     assert response.status_code == 404
 
 
-def test_aggregate_by_state():
+@pytest.mark.integration
+def test_get_all_states_not_modified(client):
+    """
+    Test GET /states returns 304 when the client already has the current data.
+    
+    Verifies:
+    - Response carries an ETag header
+    - Repeating the request with If-None-Match returns 304 with no body
+    """
+    response = client.get("/states")
+    etag = response.headers["etag"]
+    
+    response = client.get("/states", headers={"If-None-Match": etag})
+    
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+@pytest.mark.integration
+def test_get_all_states_not_modified_weak_etag(client):
+    """
+    Test GET /states returns 304 when the ETag comes back weak (W/ prefix),
+    as proxies that compress responses send it.
+    """
+    etag = client.get("/states").headers["etag"]
+    
+    response = client.get("/states", headers={"If-None-Match": f'"other", W/{etag}'})
+    
+    assert response.status_code == 304
+
+
+@pytest.mark.integration
+def test_get_single_state_not_modified(client):
+    """
+    Test GET /states/{state_name} returns 304 for a matching ETag.
+    
+    Verifies:
+    - Response carries an ETag header
+    - Repeating the request with If-None-Match returns 304 with no body
+    """
+    response = client.get("/states/Texas")
+    etag = response.headers["etag"]
+    
+    response = client.get("/states/Texas", headers={"If-None-Match": etag})
+    
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+@pytest.mark.integration
+def test_get_single_state_etag_mismatch(client):
+    """
+    Test GET /states/{state_name} with a stale ETag returns the full response.
+    
+    Verifies:
+    - Response status is 200 OK with the state data
+    - ETag and Cache-Control headers are set
+    """
+    response = client.get("/states/Texas", headers={"If-None-Match": '"stale"'})
+    
+    assert response.status_code == 200
+    assert response.json() == {"state_name": "Texas", "population": TEST_STATES["Texas"]}
+    assert response.headers["etag"] != '"stale"'
+    assert response.headers["cache-control"] == f"max-age={api.REFRESH_INTERVAL}"
+
+
+@pytest.mark.integration
+def test_get_invalid_state_with_etag(client):
+    """
+    Test GET /states/{state_name} still returns 404 for a non-existent state
+    when the client sends If-None-Match.
+    """
+    etag = client.get("/states/Texas").headers["etag"]
+    
+    response = client.get("/states/InvalidState", headers={"If-None-Match": etag})
+    
+    assert response.status_code == 404
+    assert "etag" not in response.headers
+
+
+@pytest.mark.integration
+def test_refresh_loads_data_created_after_startup(client, fresh_db):
+    """
+    Test the API starts without the state_population table and picks the
+    data up once fetch_data.py has saved it.
+    """
+    assert client.get("/states").json() == []
+    
+    fetch_data.save_to_database({"Texas": 1000})
+    api.refresh_once()
+    
+    assert client.get("/states").json() == [{"state_name": "Texas", "population": 1000}]
+
+
+@pytest.mark.integration
+def test_refresh_reloads_changed_data(client, fresh_db):
+    """
+    Test a refresh reloads the data after fetch_data.py commits new totals.
+    
+    Verifies the new population is served along with a new ETag.
+    """
+    fetch_data.save_to_database({"Texas": 1000})
+    api.refresh_once()
+    etag = client.get("/states/Texas").headers["etag"]
+    
+    fetch_data.save_to_database({"Texas": 2000})
+    api.refresh_once()
+    response = client.get("/states/Texas")
+    
+    assert response.json()["population"] == 2000
+    assert response.headers["etag"] != etag
+
+
+@pytest.mark.integration
+def test_refresh_reopens_replaced_database(client, fresh_db):
+    """
+    Test a refresh reopens the connection when the database file is
+    deleted and recreated, instead of reading the old unlinked file.
+    """
+    fetch_data.save_to_database({"Texas": 1000})
+    api.refresh_once()
+    
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(fresh_db + suffix):
+            os.remove(fresh_db + suffix)
+    fetch_data.save_to_database({"Ohio": 500})
+    api.refresh_once()
+    
+    assert client.get("/states").json() == [{"state_name": "Ohio", "population": 500}]
+
+
+@pytest.mark.integration
+def test_refresh_survives_database_error(client, fresh_db, monkeypatch):
+    """
+    Test a database error during refresh is logged instead of raised, and
+    the previously loaded data keeps being served.
+    """
+    fetch_data.save_to_database({"Texas": 1000})
+    api.refresh_once()
+    
+    def locked():
+        raise sqlite3.OperationalError("database is locked")
+    
+    monkeypatch.setattr(api, "get_data_version", locked)
+    fetch_data.save_to_database({"Texas": 2000})
+    api.refresh_once()
+    
+    assert client.get("/states/Texas").json()["population"] == 1000
+
+
+@pytest.mark.parametrize("features, expected", [
+    # Multiple counties in same state are summed, different states kept separate
+    (
+        [
+            {"attributes": {"STATE_NAME": "Texas", "POPULATION": 1000}},
+            {"attributes": {"STATE_NAME": "Texas", "POPULATION": 2000}},
+            {"attributes": {"STATE_NAME": "California", "POPULATION": 500}},
+        ],
+        {"Texas": 3000, "California": 500},
+    ),
+    # None/null population values are treated as 0
+    (
+        [
+            {"attributes": {"STATE_NAME": "TestState", "POPULATION": 1000}},
+            {"attributes": {"STATE_NAME": "TestState", "POPULATION": None}},
+        ],
+        {"TestState": 1000},
+    ),
+])
+def test_aggregate_by_state(features, expected):
     """
     Test aggregate_by_state function with test data.
     
     Verifies:
     - Multiple counties in same state are summed correctly
     - Different states are kept separate
-    - Output format matches expectations
+    - None values are treated as 0 and don't cause errors
     """
-    # Test data - simulates API response structure
-    test_features = [
-        {"attributes": {"STATE_NAME": "Texas", "POPULATION": 1000}},
-        {"attributes": {"STATE_NAME": "Texas", "POPULATION": 2000}},
-        {"attributes": {"STATE_NAME": "California", "POPULATION": 500}},
-    ]
+    result = aggregate_by_state(features)
     
-    # Execute function
-    result = aggregate_by_state(test_features)
+    assert result == expected
+
+
+class FakeResponse:
+    """
+    Minimal stand-in for requests.Response holding a JSON payload.
+    """
+    def __init__(self, payload):
+        self.content = orjson.dumps(payload)
+
+    def raise_for_status(self):
+        pass
+
+
+def make_counties_api(total, page_cap, fail_at=None, error_at=None, short_at=None):
+    """
+    Build a fake SESSION.get that serves `total` counties in pages of at
+    most `page_cap` records, like an ArcGIS layer with that maxRecordCount.
     
-    # Expected result
-    expected = {"Texas": 3000, "California": 500}
+    Args:
+        total (int): Number of counties the fake layer holds
+        page_cap (int): Largest page the fake server returns
+        fail_at (int | None): Offset whose request raises an error
+        error_at (int | None): Offset answered with an ArcGIS error body
+            and HTTP 200, as the real service does
+        short_at (int | None): Offset answered with one record fewer
+        
+    Returns:
+        Tuple[Callable, List[int]]: Fake get function and the list of
+        offsets it was asked for
+    """
+    offsets = []
+
+    def fake_get(url, params, timeout):
+        if params.get("returnCountOnly"):
+            return FakeResponse({"count": total})
+
+        offset = params["resultOffset"]
+        offsets.append(offset)
+        if offset == fail_at:
+            raise ConnectionError("connection reset")
+        if offset == error_at:
+            return FakeResponse({
+                "error": {"code": 400, "message": "Unable to complete operation."}
+            })
+
+        size = min(params["resultRecordCount"], page_cap, total - offset)
+        if offset == short_at:
+            size -= 1
+        features = [
+            {"attributes": {"STATE_NAME": "Texas", "POPULATION": 1}}
+        ] * size
+        return FakeResponse({
+            "features": features,
+            "exceededTransferLimit": offset + size < total
+        })
+
+    return fake_get, offsets
+
+
+def test_iter_counties_data_single_page(monkeypatch):
+    """
+    Test iter_counties_data with a result that fits in one page.
     
-    # Assertions
-    assert result == expected
-    assert result["Texas"] == 3000
-    assert result["California"] == 500
+    Verifies only the first page is requested and all features are yielded.
+    """
+    fake_get, offsets = make_counties_api(total=5, page_cap=2000)
+    monkeypatch.setattr(fetch_data.SESSION, "get", fake_get)
+    
+    features = list(iter_counties_data())
+    
+    assert len(features) == 5
+    assert offsets == [0]
 
 
-def test_aggregate_by_state_with_none():
+def test_iter_counties_data_capped_pages(monkeypatch):
     """
-    Test aggregate_by_state handles None/null population values.
+    Test iter_counties_data against a server that caps pages below PAGE_SIZE.
     
-    Verifies that None values are treated as 0 and don't cause errors.
+    Verifies the first page's size is used as the page size for the
+    remaining offsets and every county is yielded exactly once.
     """
-    test_features = [
-        {"attributes": {"STATE_NAME": "TestState", "POPULATION": 1000}},
-        {"attributes": {"STATE_NAME": "TestState", "POPULATION": None}},
-    ]
+    fake_get, offsets = make_counties_api(total=2500, page_cap=1000)
+    monkeypatch.setattr(fetch_data.SESSION, "get", fake_get)
+    
+    features = list(iter_counties_data())
+    
+    assert len(features) == 2500
+    assert sorted(offsets) == [0, 1000, 2000]
+
+
+def test_main_skips_save_on_failed_page(monkeypatch):
+    """
+    Test that a page failing mid-stream aborts the run without saving.
+    
+    Verifies the error propagates out of iter_counties_data and main
+    does not overwrite the database with partial totals.
+    """
+    fake_get, _ = make_counties_api(total=3143, page_cap=1000, fail_at=2000)
+    monkeypatch.setattr(fetch_data.SESSION, "get", fake_get)
+    saved = []
+    monkeypatch.setattr(fetch_data, "save_to_database", saved.append)
+    
+    with pytest.raises(ConnectionError):
+        list(iter_counties_data())
+    
+    fetch_data.main()
+    
+    assert saved == []
+
+
+@pytest.mark.parametrize("api_options", [
+    # ArcGIS error body returned with HTTP 200
+    {"error_at": 2000},
+    # Page with fewer records than requested
+    {"short_at": 1000},
+])
+def test_main_skips_save_on_incomplete_fetch(monkeypatch, api_options):
+    """
+    Test that an incomplete fetch is detected and nothing is saved.
+    
+    Verifies that an error body or a short page raises out of
+    iter_counties_data and main does not save the partial totals.
+    """
+    fake_get, _ = make_counties_api(total=3000, page_cap=1000, **api_options)
+    monkeypatch.setattr(fetch_data.SESSION, "get", fake_get)
+    saved = []
+    monkeypatch.setattr(fetch_data, "save_to_database", saved.append)
+    
+    with pytest.raises(RuntimeError):
+        list(iter_counties_data())
     
-    result = aggregate_by_state(test_features)
+    fetch_data.main()
     
-    assert result["TestState"] == 1000
\ No newline at end of file
+    assert saved == []